@@ -11,45 +11,62 @@ OpenSea: https://opensea.io/collection/firstproject
 """
 
 # Imports
+from array import array
 from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from scipy import stats
+from numba import njit
+from pathlib import Path
 from typing import Any, Dict, List, Tuple
-from web3 import Web3, exceptions
+from web3 import Web3
+import aiohttp
+import asyncio
+import json
 import matplotlib.pyplot as plt
 import numpy as np
 import re
 import requests
+import shelve
 import sys
-import time
 
 # Constants
 CONTRACT_ADDRESS = '0xc9Cb0FEe73f060Db66D2693D92d75c825B1afdbF'
 ETHERSCAN_API_KEY = 'YOUR-ETHERSCAN-API-KEY'
 INFURA_PROJECT_ID = 'YOUR-PROJECT-ID'
+INFURA_URL = f'https://mainnet.infura.io/v3/{INFURA_PROJECT_ID}'
 LIMIT = 50  # 50 NFT limit per query of OpenSea API
 MAX_SUPPLY = 5000  # Number of First First NFTs
 THOUSAND = 1000
 HUNDRED = 100
 ROUND_DIGITS = 2
-PROGRESS_BAR_LENGTH = (MAX_SUPPLY / THOUSAND)  # 5 slots for progress bar
+PROGRESS_BAR_LENGTH = (MAX_SUPPLY // THOUSAND)  # 5 slots for progress bar
 OPENSEA_API_SLEEP_TIME = .1  # Seconds between queries to avoid rate limiting
-INFURA_API_SLEEP_TIME = .002  # Seconds between queries to avoid rate limiting
+OPENSEA_MAX_CONCURRENCY = 10  # Maximum number of in-flight OpenSea queries
+INFURA_MAX_WORKERS = 16  # Number of threads querying Infura concurrently
+INFURA_BATCH_SIZE = 100  # Number of contract calls per JSON-RPC batch request
+ABI_CACHE_DIR = Path('.abi_cache')  # Contract ABIs are immutable, so they are fetched from Etherscan once
+CLAIMED_CACHE_DIR = Path('.claimed_cache')  # Claimed Token IDs are cached once the collection is fully minted
+TEXT_CACHE_FILE = f'.text_cache_{CONTRACT_ADDRESS}'  # Texts of minted NFTs are immutable, so each one is queried once
 REGEX = '[^0-9a-zA-Z%-\\.]+'  # Regex to parse out non-alphanumeric characters except '%', '-', and '.'
+REGEX_PATTERN = re.compile(REGEX)
 
 
-def send_request(url: str) -> requests.models.Response:
+def send_request(url: str, payload: Any = None) -> requests.models.Response:
     """Send a request to an endpoint.
 
     Args:
         url (str): Endpoint.
+        payload (Any): JSON body to POST. A GET request is sent if omitted.
 
     Returns:
         response (Response): Request response.
     """
 
     try:
-        response = requests.get(url)
+        if payload is None:
+            response = requests.get(url)
+        else:
+            response = requests.post(url, json=payload)
         response.raise_for_status()
 
         return response
@@ -64,18 +81,65 @@ def send_request(url: str) -> requests.models.Response:
     exit()
 
 
+async def send_async_request(session: aiohttp.ClientSession, url: str) -> Any:
+    """Send an asynchronous request to an endpoint.
+
+    Args:
+        session (ClientSession): Shared HTTP session.
+        url (str): Endpoint.
+
+    Returns:
+        data (Any): Decoded JSON response.
+    """
+
+    try:
+        async with session.get(url) as response:
+            response.raise_for_status()
+
+            return await response.json()
+    except aiohttp.ClientResponseError as errh:
+        print(f'HTTP Error: {errh}')
+    except aiohttp.ClientConnectionError as errc:
+        print(f'Connection Error: {errc}')
+    except asyncio.TimeoutError as errt:
+        print(f'Timeout Error: {errt}')
+    except aiohttp.ClientError as err:
+        print(f'Something Else: {err}')
+    exit()
+
+
 def connect_to_contract() -> Any:
     """Connect to Ethereum contract using Web3.
 
+    The contract ABI is read from ABI_CACHE_DIR if present, otherwise it is fetched from Etherscan and cached.
+
     Returns:
         contract (Contract): Ethereum contract.
     """
 
-    w3 = Web3(Web3.HTTPProvider(f'https://mainnet.infura.io/v3/{INFURA_PROJECT_ID}'))
-    response = send_request(f'https://api.etherscan.io/api?module=contract&action=getabi&address={CONTRACT_ADDRESS}&apikey={ETHERSCAN_API_KEY}')
-    abi = response.json()['result']
+    w3 = Web3(Web3.HTTPProvider(INFURA_URL))
+
+    abi_cache = ABI_CACHE_DIR / f'{CONTRACT_ADDRESS}.json'
+    cached = abi_cache.exists()
+    if cached:
+        abi = abi_cache.read_text()
+    else:
+        response = send_request(f'https://api.etherscan.io/api?module=contract&action=getabi&address={CONTRACT_ADDRESS}&apikey={ETHERSCAN_API_KEY}')
+
+        # Etherscan reports errors such as an invalid API key with a 200 response
+        if response.json()['status'] != '1':
+            print(f"Etherscan Error: {response.json()['result']}")
+            exit()
+
+        abi = response.json()['result']
+
     checksum_address = w3.toChecksumAddress(CONTRACT_ADDRESS)
-    contract = w3.eth.contract(address=checksum_address, abi=abi)
+    contract = w3.eth.contract(address=checksum_address, abi=json.loads(abi))
+
+    # Only cache the ABI once it has been parsed into a contract
+    if not cached:
+        ABI_CACHE_DIR.mkdir(exist_ok=True)
+        abi_cache.write_text(abi)
 
     return contract
 
@@ -103,50 +167,64 @@ def print_progress_bar(count: int) -> None:
         count (int): Number of 1000 query chunks.
     """
 
-    # left side of progress bar
-    progress_bar = '['
-
-    # Fill in progress bar
-    for i in range(0, count):
-        progress_bar += '#'
-
-    # Fill in remaining slots with an underscore
-    while len(progress_bar) <= PROGRESS_BAR_LENGTH:
-        progress_bar += '_'
-
-    # Right side of progress bar
-    progress_bar += ']'
+    # Fill in progress bar and remaining slots with an underscore
+    progress_bar = '[' + '#' * count + '_' * (PROGRESS_BAR_LENGTH - count) + ']'
 
     print(f'PROGRESS: {progress_bar}')
 
 
-def get_claimed_token_ids() -> List[int]:
+async def get_claimed_token_ids() -> List[int]:
     """Get claimed Token IDs using OpenSea API.
 
     This step is required because only 5000 Token IDs were minted out of a possible space of (1, 999999).
     https://twitter.com/_deafbeef/status/1434972438803144706
 
+    Pages are queried concurrently, bounded by OPENSEA_MAX_CONCURRENCY to avoid rate limiting. Once all MAX_SUPPLY
+    distinct Token IDs are collected they are cached in CLAIMED_CACHE_DIR and OpenSea is skipped on later runs.
+
     Returns:
         claimed (list[int]): List of claimed Token IDs.
     """
 
+    # Use cached Token IDs if the collection was fully collected before
+    claimed_cache = CLAIMED_CACHE_DIR / f'{CONTRACT_ADDRESS}.json'
+    if claimed_cache.exists():
+        claimed = json.loads(claimed_cache.read_text())
+
+        if len(set(claimed)) == MAX_SUPPLY:
+            return claimed
+
     # Initialize
-    claimed = []
-    offset = 0
+    urls = [f'https://api.opensea.io/api/v1/assets?offset={offset}&limit={LIMIT}&asset_contract_address={CONTRACT_ADDRESS}'
+            for offset in range(0, MAX_SUPPLY, LIMIT)]
+    semaphore = asyncio.Semaphore(OPENSEA_MAX_CONCURRENCY)
+    completed = 0
 
-    while offset <= (MAX_SUPPLY - LIMIT):
-        response = send_request(f'https://api.opensea.io/api/v1/assets?offset={offset}&limit={LIMIT}&asset_contract_address={CONTRACT_ADDRESS}')
+    async def fetch(session: aiohttp.ClientSession, url: str) -> List[int]:
+        nonlocal completed
 
-        for nft in response.json()['assets']:
-            claimed.append(int(nft['token_id']))
+        async with semaphore:
+            data = await send_async_request(session, url)
+            await asyncio.sleep(OPENSEA_API_SLEEP_TIME)
 
-        offset += LIMIT
+        completed += LIMIT
 
         # Print progress every 1000 queries
-        if offset == LIMIT or (offset % THOUSAND) == 0:
-            print_progress_bar(offset // THOUSAND)
+        if completed == LIMIT or (completed % THOUSAND) == 0:
+            print_progress_bar(completed // THOUSAND)
+
+        return [int(nft['token_id']) for nft in data['assets']]
+
+    # Share one session to reuse the connection pool
+    async with aiohttp.ClientSession() as session:
+        pages = await asyncio.gather(*[fetch(session, url) for url in urls])
 
-        time.sleep(OPENSEA_API_SLEEP_TIME)
+    claimed = [token_id for page in pages for token_id in page]
+
+    # Only cache a complete collection without duplicates so partial or shifted results are queried again
+    if len(set(claimed)) == MAX_SUPPLY:
+        CLAIMED_CACHE_DIR.mkdir(exist_ok=True)
+        claimed_cache.write_text(json.dumps(claimed))
 
     return claimed
 
@@ -165,7 +243,70 @@ def print_end_time(message: str, start: datetime) -> None:
     print(f'DURATION: {end - start}\n')
 
 
-def organize_text_data(claimed: List[int], contract: Any) -> Tuple[List[str], List[int], List[str], Dict[str, List[int]], Dict[int, List[int]], Dict[str, List[int]]]:
+def get_texts(claimed: List[int], contract: Any) -> List[str]:
+    """Get text of each claimed Token ID from the contract.
+
+    Texts are cached in TEXT_CACHE_FILE and only uncached Token IDs are queried. Calls are packed into JSON-RPC
+    batch requests of INFURA_BATCH_SIZE, and the batches are sent concurrently from a thread pool since each one
+    is bound by a network round trip.
+
+    Args:
+        claimed (list[int]): List of claimed Token IDs.
+        contract (Contract): Ethereum contract.
+
+    Returns:
+        texts (list[str]): Texts in the same order as the claimed Token IDs.
+    """
+
+    def get_batch(token_ids: List[int]) -> List[str]:
+        payload = [{'jsonrpc': '2.0',
+                    'id': request_id,
+                    'method': 'eth_call',
+                    'params': [{'to': contract.address, 'data': contract.encodeABI(fn_name='getString', args=[token_id])}, 'latest']}
+                   for request_id, token_id in enumerate(token_ids)]
+        response = send_request(INFURA_URL, payload=payload)
+        results = response.json()
+
+        # A rejected batch is answered with a single error object instead of a list
+        if not isinstance(results, list) or len(results) != len(token_ids):
+            print(f'Batch Error: {results}')
+            exit()
+
+        # Responses in a batch may arrive in any order
+        batch_texts = []
+        for result in sorted(results, key=lambda x: x['id']):
+            if 'error' in result:
+                print(f"Contract Error: {result['error']}")
+                exit()
+
+            batch_texts.append(contract.web3.codec.decode_abi(['string'], Web3.toBytes(hexstr=result['result']))[0])
+
+        return batch_texts
+
+    with shelve.open(TEXT_CACHE_FILE) as cache:
+        # Initialize
+        uncached = [token_id for token_id in claimed if str(token_id) not in cache]
+        batches = [uncached[i:i + INFURA_BATCH_SIZE] for i in range(0, len(uncached), INFURA_BATCH_SIZE)]
+        completed = len(claimed) - len(uncached)
+
+        # Cache is only written from the main thread
+        with ThreadPoolExecutor(max_workers=INFURA_MAX_WORKERS) as executor:
+            for batch_count, (batch, batch_texts) in enumerate(zip(batches, executor.map(get_batch, batches))):
+                for token_id, text in zip(batch, batch_texts):
+                    cache[str(token_id)] = text
+
+                # Print progress every 1000 queries
+                previous = completed
+                completed += len(batch)
+                if batch_count == 0 or (completed // THOUSAND) > (previous // THOUSAND):
+                    print_progress_bar(completed // THOUSAND)
+
+        texts = [cache[str(token_id)] for token_id in claimed]
+
+    return texts
+
+
+def organize_text_data(claimed: List[int], contract: Any) -> Tuple[List[str], array, array, List[str], Dict[str, List[int]], Dict[int, List[int]], Dict[str, List[int]]]:
     """Organizes text data.
 
     Args:
@@ -174,7 +315,8 @@ def organize_text_data(claimed: List[int], contract: Any) -> Tuple[List[str], Li
 
     Returns:
         output_words (list[str]): List of words used in text.
-        output_total_word_counts (list[int]): List of count of words used in each text.
+        output_word_lengths (array[int]): Packed length of each word in output_words.
+        output_total_word_counts (array[int]): Packed count of words used in each text.
         output_complete_texts (list[str]): List of complete texts.
         output_word_to_token_id (dict[str: list[int]]): Word to Token ID mapping.
         output_total_word_count_to_token_id (dict[int: list[int]]): Total word count to Token ID mapping.
@@ -183,71 +325,94 @@ def organize_text_data(claimed: List[int], contract: Any) -> Tuple[List[str], Li
 
     # Initialize
     output_words = []
-    output_total_word_counts = []
+    output_word_lengths = array('i')
+    output_total_word_counts = array('i')
     output_complete_texts = []
-    output_word_to_token_id = defaultdict(lambda: [])
-    output_total_word_count_to_token_id = defaultdict(lambda: [])
-    output_complete_text_to_token_id = defaultdict(lambda: [])
-
-    for query_progress_count, token_id in enumerate(claimed):
-        try:
-            # Get text
-            text = contract.functions.getString(token_id).call()
-            text = text.lower()
-            text = text[:len(text) - 1]  # Remove period at end of text
-            output_complete_texts.append(text)
-
-            # Populate complete text to Token ID mapping
-            output_complete_text_to_token_id[text].append(token_id)
-
-            # Replace non-alphanumeric characters with a space, but keep % and - symbols
-            text = re.sub(REGEX, ' ', text)
-
-            # Remove empty strings from list
-            text = text.split(' ')
-            text = [item for item in text if item != '']
-
-            # Store words and total word counts
-            output_words.append(text)
-            output_total_word_counts.append(len(text))
-
-            # Populate word to Token ID mapping
-            for word in text:
-                output_word_to_token_id[word].append(token_id)
-
-            # Populate total word count to Token ID mapping
-            output_total_word_count_to_token_id[len(text)].append(token_id)
-
-            # Print progress every 1000 queries
-            if query_progress_count == 0 or ((query_progress_count + 1) % THOUSAND) == 0:
-                print_progress_bar((query_progress_count + 1) // THOUSAND)
-
-            time.sleep(INFURA_API_SLEEP_TIME)
-        except exceptions.SolidityError as error:
-            print(error)
-            exit()
+    output_word_to_token_id = defaultdict(list)
+    output_total_word_count_to_token_id = defaultdict(list)
+    output_complete_text_to_token_id = defaultdict(list)
+
+    for token_id, text in zip(claimed, get_texts(claimed, contract)):
+        text = text.lower()
+        text = text[:len(text) - 1]  # Remove period at end of text
+        output_complete_texts.append(text)
+
+        # Populate complete text to Token ID mapping
+        output_complete_text_to_token_id[text].append(token_id)
 
-    # Flatten list of lists
-    output_words = [item for sub in output_words for item in sub]
+        # Split on non-alphanumeric characters, but keep % and - symbols, and remove empty strings
+        # Words are interned so repeated words share one string object
+        text = [sys.intern(item) for item in REGEX_PATTERN.split(text) if item]
 
-    return output_words, output_total_word_counts, output_complete_texts, output_word_to_token_id, \
+        # Store words, word lengths, and total word counts
+        output_words.extend(text)
+        output_word_lengths.extend(map(len, text))
+        output_total_word_counts.append(len(text))
+
+        # Populate word to Token ID mapping
+        for word in text:
+            output_word_to_token_id[word].append(token_id)
+
+        # Populate total word count to Token ID mapping
+        output_total_word_count_to_token_id[len(text)].append(token_id)
+
+    return output_words, output_word_lengths, output_total_word_counts, output_complete_texts, output_word_to_token_id, \
         output_total_word_count_to_token_id, output_complete_text_to_token_id
 
 
-def print_descriptive_stats(word_data: List[int], type_text: str, detail_text: str) -> None:
+@njit(cache=True)
+def compute_descriptive_stats(data: np.ndarray) -> Tuple[float, float, int, float]:
+    """Compute descriptive statistics in a single pass plus one sort.
+
+    Args:
+        data (ndarray): Non-negative word lengths or total word counts.
+
+    Returns:
+        mean (float): Mean.
+        median (float): Median.
+        mode (int): Smallest most common value.
+        std (float): Population standard deviation.
+    """
+
+    # Accumulate sums and value counts
+    n = data.shape[0]
+    counts = np.zeros(data.max() + 1, dtype=np.int64)
+    total = 0.0
+    total_squared = 0.0
+    for i in range(n):
+        value = data[i]
+        total += value
+        total_squared += value * value
+        counts[value] += 1
+
+    mean = total / n
+    std = np.sqrt(max(total_squared / n - mean * mean, 0.0))
+    mode = counts.argmax()
+
+    # Median
+    data_sorted = np.sort(data)
+    if n % 2 == 1:
+        median = float(data_sorted[n // 2])
+    else:
+        median = (data_sorted[n // 2 - 1] + data_sorted[n // 2]) / 2
+
+    return mean, median, mode, std
+
+
+def print_descriptive_stats(word_data: List[int] or np.ndarray, type_text: str, detail_text: str) -> None:
     """Print descriptive statistics.
 
     Args:
-        word_data (list[int]): List of word lengths or total word counts.
+        word_data (list[int] or ndarray): Word lengths or total word counts.
         type_text (str): WORD or TEXT.
         detail_text (str): CHARACTERS or WORDS.
     """
 
     # Calculate descriptive statistics
-    mean = round(float(np.mean(word_data)), ROUND_DIGITS)
-    median = round(float(np.median(word_data)), ROUND_DIGITS)
-    mode = stats.mode(word_data)[0][0]
-    std = round(float(np.std(word_data)), ROUND_DIGITS)
+    mean, median, mode, std = compute_descriptive_stats(np.asarray(word_data))
+    mean = round(mean, ROUND_DIGITS)
+    median = round(median, ROUND_DIGITS)
+    std = round(std, ROUND_DIGITS)
 
     print(f'{type_text} INFO')
     print(f'MEAN {type_text} LENGTH: {mean} {detail_text}')
@@ -263,11 +428,7 @@ def print_longest_word(word_data: List[str]) -> None:
         word_data (list[str]): All words used in text.
     """
 
-    longest_word = ''
-
-    for word in word_data:
-        if len(word) > len(longest_word):
-            longest_word = word
+    longest_word = max(word_data, key=len, default='')
 
     print(f'LONGEST WORD: {longest_word}')
 
@@ -279,25 +440,25 @@ def print_distinct_words(word_data: List[str]) -> None:
         word_data (list[str]): All words used in text.
     """
 
-    word_data_dedup = list(set(word_data))
-    num_words = len(word_data_dedup)
+    num_words = len(set(word_data))
 
     print(f'NUMBER OF DISTINCT WORDS: {num_words}')
     print(f'TOTAL WORDS: {len(word_data)}\n')
 
 
-def generate_plot(data: List[int], bins: range, type_text: str, detail_text: str) -> None:
+def generate_plot(data: List[int] or np.ndarray, bins: range, type_text: str, detail_text: str) -> None:
     """Generate and save histogram.
 
     Args:
-        data (list[int]): List of word lengths or total word counts.
+        data (list[int] or ndarray): Word lengths or total word counts.
         bins (range): Bins.
         type_text (str): WORD or TEXT.
         detail_text (str): CHARACTERS or WORDS.
     """
 
-    # Plot histogram
-    plt.hist(x=data, bins=bins, density=True, facecolor='lightskyblue', alpha=0.75)
+    # Bin once with NumPy and plot histogram
+    density, edges = np.histogram(data, bins=bins, density=True)
+    plt.bar(edges[:-1], density, width=np.diff(edges), align='edge', facecolor='lightskyblue', alpha=0.75)
 
     # Plot settings
     # General
@@ -322,11 +483,11 @@ def generate_plot(data: List[int], bins: range, type_text: str, detail_text: str
     plt.clf()
 
 
-def get_rarity(data: List[int or str], mapping: Dict[str or int, List[int]], total: int) -> List[Tuple[str or int, int, str, List[int]]]:
+def get_rarity(data: List[int or str] or np.ndarray, mapping: Dict[str or int, List[int]], total: int) -> List[Tuple[str or int, int, str, List[int]]]:
     """Get counts and rarity.
 
     Args:
-        data (list[str or int]): Data to count and compute rarity for.
+        data (list[str or int] or ndarray): Data to count and compute rarity for. Integer arrays are counted with NumPy.
         mapping (dict[str or int, list[int]]): Maps data to Token IDs.
         total (int): Denominator used when computing rarity.
 
@@ -335,16 +496,18 @@ def get_rarity(data: List[int or str], mapping: Dict[str or int, List[int]], tot
     """
 
     # Get count
-    counter = Counter(data)
-    rarity = Counter()
+    if isinstance(data, np.ndarray) and np.issubdtype(data.dtype, np.integer):
+        keys, first_indices, counts = np.unique(data, return_index=True, return_counts=True)
 
-    # Calculate rarity
-    for key, value in counter.items():
-        rarity[key] = str(round((value / total) * HUNDRED, ROUND_DIGITS)) + '%'
+        # Restore first-appearance order so ties sort the same way as with Counter
+        order = np.argsort(first_indices)
+        counter = dict(zip(keys[order].tolist(), counts[order].tolist()))
+    else:
+        counter = Counter(data)
 
-    # Create and sort list of tuples
-    output = [(key, value, rarity[key], mapping[key]) for key, value in counter.items()]
-    output = sorted(output, key=lambda x: x[1])
+    # Calculate rarity and create list of tuples sorted by count
+    output = [(key, value, f'{round((value / total) * HUNDRED, ROUND_DIGITS)}%', mapping[key])
+              for key, value in sorted(counter.items(), key=lambda x: x[1])]
 
     return output
 
@@ -359,16 +522,8 @@ def write_to_file(filename: str, header: str, data: List[Tuple[str or int, int,
     """
 
     with open(filename, 'w') as f:
-        sys.stdout = f
-
-        print(header)
-        for text, count, rarity, token_ids in data:
-            token_ids = [str(item) for item in token_ids]
-            token_ids = ';'.join(token_ids)
-
-            print(f'{text},{count},{rarity},[{token_ids}]')
-
-        sys.stdout.close()
+        f.write(f'{header}\n')
+        f.writelines(f'{text},{count},{rarity},[{";".join(map(str, token_ids))}]\n' for text, count, rarity, token_ids in data)
 
 
 if __name__ == '__main__':
@@ -377,22 +532,23 @@ if __name__ == '__main__':
 
     # Get claimed Token IDs
     starting_time = print_start_time('STARTED COLLECTING CLAIMED TOKEN IDS:')
-    claimed_token_ids = get_claimed_token_ids()
+    claimed_token_ids = asyncio.run(get_claimed_token_ids())
     print_end_time('FINISHED COLLECTING CLAIMED TOKEN IDS:', starting_time)
 
     # Sanity check
-    if len(claimed_token_ids) != MAX_SUPPLY:
-        print('There should be 5000 tokens. Something went wrong.')
+    if len(set(claimed_token_ids)) != MAX_SUPPLY:
+        print('There should be 5000 distinct tokens. Something went wrong.')
         exit()
 
     # Organize data for words, word counts, and complete texts
     starting_time = print_start_time('STARTED QUERYING CONTRACT:')
-    words, total_word_counts, complete_texts, word_to_token_id, \
+    words, word_lengths, total_word_counts, complete_texts, word_to_token_id, \
         total_word_count_to_token_id, complete_text_to_token_id = organize_text_data(claimed_token_ids, nft_contract)
     print_end_time('FINISHED QUERYING CONTRACT:', starting_time)
+    word_lengths = np.frombuffer(word_lengths, dtype=np.intc)
+    total_word_counts = np.frombuffer(total_word_counts, dtype=np.intc)
 
     # Print descriptive statistics for word lengths
-    word_lengths = [len(word) for word in words]
     print_descriptive_stats(word_data=word_lengths, type_text='WORD', detail_text='CHARACTERS')
 
     # Print longest word